@@ -1,10 +1,56 @@
+import argparse
 import sys
+import time
 from kanjibot import core
 
 
 def main(argv):
-    if '--init-db' in argv:
+    parser = argparse.ArgumentParser(prog='kanjibot')
+    parser.add_argument(
+        '--init-db', action='store_true',
+        help='fill the database with data'
+    )
+    parser.add_argument(
+        '--build-assets', action='store_true',
+        help='prerender images of all kanji into the asset bundle'
+    )
+    parser.add_argument(
+        '--storage-stats', nargs='?', const='both', metavar='LAYOUT',
+        choices=['both', 'normalized', 'compact'],
+        help='compare size and lookup time of the word storage layouts,'
+             ' time only LAYOUT (normalized or compact) if given'
+    )
+    parser.add_argument(
+        '--batch', metavar='INPUT',
+        help='answer comments from a JSON lines file instead of reddit'
+    )
+    parser.add_argument(
+        '--out', metavar='OUTPUT', default='replies.jsonl',
+        help='where --batch writes the replies'
+    )
+    parser.add_argument(
+        '--processes', type=int,
+        help='number of worker processes for --batch and --build-assets,'
+             ' defaults to CPU count'
+    )
+    parser.add_argument(
+        '--all-lines', action='store_true',
+        help='with --batch, answer every line, not only summons'
+    )
+    args = parser.parse_args(argv[1:])
+
+    if args.init_db:
         core.init_database()
+    elif args.build_assets:
+        core.build_assets(args.processes)
+    elif args.storage_stats:
+        core.print_storage_stats(
+            None if args.storage_stats == 'both' else args.storage_stats
+        )
+    elif args.batch:
+        from kanjibot import batch
+        batch.run(args.batch, args.out, args.processes,
+                  all_lines=args.all_lines)
     else:
         while True:
             try:
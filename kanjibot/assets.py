@@ -0,0 +1,156 @@
+'''
+Kanjibot -- a reddit bot that posts information about kanji
+Copyright (C) 2017  Vojtech Balak
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+from io import BytesIO
+
+MAGIC = b'KBAB'
+HEADER = struct.Struct('<4sI')
+
+
+class AssetBundle:
+    '''
+    Read-only access to prerendered images. The bundle starts with
+    a JSON index mapping each kanji and kind ('preview' or 'stroke') to
+    the offset, length and SHA-256 of a PNG in the data that follows.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_size = HEADER.unpack(self.data[:HEADER.size])
+        if magic != MAGIC:
+            raise ValueError(path+' is not an asset bundle')
+        start = HEADER.size + index_size
+        self.index = json.loads(self.data[HEADER.size:start].decode('utf-8'))
+        self.start = start
+
+    def __contains__(self, key):
+        kanji, kind = key
+        return kind in self.index.get(kanji, {})
+
+    def get(self, kanji, kind):
+        '''
+        Returns PNG data or None if the bundle doesn't have it or it is
+        corrupted, in which case the caller renders the image itself.
+        '''
+
+        entry = self.index.get(kanji, {}).get(kind)
+        if entry is None:
+            return None
+        offset, length, digest = entry
+        data = self.data[self.start + offset:self.start + offset + length]
+        if hashlib.sha256(data).hexdigest() != digest:
+            print('Corrupted '+kind+' image of '+kanji+' in asset bundle')
+            return None
+        return data
+
+
+def _compress(image, colors):
+    ''' Quantizes an image to a palette and returns optimized PNG data. '''
+
+    from PIL import Image
+
+    if image.mode == 'RGBA':
+        image = image.quantize(colors, method=Image.FASTOCTREE)
+    else:
+        image = image.convert('RGB').quantize(colors)
+    buff = BytesIO()
+    image.save(buff, format='PNG', optimize=True)
+    return buff.getvalue()
+
+
+def _render(kanji):
+    ''' Runs in a worker process and returns the assets of one kanji. '''
+
+    from PIL import Image
+    from kanjibot import core
+
+    assets = {}
+    preview = core.render_preview(kanji).convert('RGB')
+    assets['preview'] = _compress(preview, 16)
+    path = core.get_stroke_image_path(kanji)
+    if path is not None:
+        with Image.open(path) as img:
+            assets['stroke'] = _compress(img.convert('RGBA'), 64)
+
+    return kanji, {
+        kind: (data, hashlib.sha256(data).hexdigest())
+        for kind, data in assets.items()
+    }
+
+
+def build(path, kanji_list, processes=None, chunk_size=32):
+    '''
+    Renders previews and recompresses stroke order images of all kanji
+    using a pool of processes and packs them into a bundle at path.
+    Identical images are stored once.
+    '''
+
+    index = {}
+    stored = {}
+    size = 0
+    with tempfile.TemporaryFile() as data, \
+            multiprocessing.Pool(processes) as pool:
+        for i, (kanji, assets) in enumerate(
+                pool.imap(_render, kanji_list, chunk_size)
+        ):
+            for kind, (blob, digest) in assets.items():
+                if digest not in stored:
+                    stored[digest] = (size, len(blob))
+                    data.write(blob)
+                    size += len(blob)
+                offset, length = stored[digest]
+                index.setdefault(kanji, {})[kind] = [offset, length, digest]
+            if (i + 1) % 1000 == 0:
+                print('Rendered '+str(i + 1)+' kanji')
+
+        header = json.dumps(index, ensure_ascii=False).encode('utf-8')
+        data.seek(0)
+        # A running bot may have the old bundle mapped, overwriting it in
+        # place would change the data under it. The new bundle is written
+        # next to it and replaces it in one step.
+        with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(path) or '.', delete=False
+        ) as f:
+            try:
+                f.write(HEADER.pack(MAGIC, len(header)))
+                f.write(header)
+                shutil.copyfileobj(data, f)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        # Temporary files are only readable by their owner, the bot may run
+        # as another user.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(f.name, 0o644 & ~umask)
+        os.replace(f.name, path)
+
+    print(
+        'Bundled '+str(len(index))+' kanji, '
+        + str(len(stored))+' unique images, '+str(size // 1024)+' KiB'
+    )
@@ -0,0 +1,81 @@
+'''
+Kanjibot -- a reddit bot that posts information about kanji
+Copyright (C) 2017  Vojtech Balak
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import functools
+import itertools
+import json
+import multiprocessing
+
+from kanjibot import core
+
+
+def _answer(comment, all_lines=False):
+    ''' Runs in a worker process, every worker has its own db connection. '''
+
+    return core.get_replies(
+        comment.get('body', ''),
+        upload_images=False,
+        all_lines=all_lines
+    )
+
+
+def _read_comments(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def run(input_path, output_path, processes=None, chunk_size=16,
+        all_lines=False):
+    '''
+    Answers comments from a JSON lines file (objects with a 'body' and
+    optionally an 'id') and writes the replies to another JSON lines file
+    in input order. No images are uploaded.
+    '''
+
+    # Read-only data is loaded before the workers are forked so they share
+    # it, so fork is used even where it isn't the default start method.
+    # The connection used for that can't be shared, so it is closed and
+    # each worker opens its own on its first query.
+    core.get_component_index()
+    core.get_db().close()
+
+    processes = processes or multiprocessing.cpu_count()
+    # Only a few chunks per worker are in flight at any time, so memory use
+    # doesn't depend on the size of the input.
+    window = processes * chunk_size * 4
+    count = 0
+    with open(input_path, 'r') as f, open(output_path, 'w') as out, \
+            multiprocessing.get_context('fork').Pool(processes) as pool:
+        comments = _read_comments(f)
+        while True:
+            batch = list(itertools.islice(comments, window))
+            if not batch:
+                break
+            results = pool.imap(
+                functools.partial(_answer, all_lines=all_lines),
+                batch,
+                chunk_size
+            )
+            for comment, replies in zip(batch, results):
+                out.write(json.dumps(
+                    {'id': comment.get('id'), 'replies': replies},
+                    ensure_ascii=False
+                )+'\n')
+            count += len(batch)
+            print('Processed '+str(count)+' comments')
@@ -0,0 +1,87 @@
+'''
+Kanjibot -- a reddit bot that posts information about kanji
+Copyright (C) 2017  Vojtech Balak
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import hashlib
+import math
+import struct
+
+MAGIC = b'KBBF'
+HEADER = struct.Struct('<4sQI')
+
+
+class BloomFilter:
+    '''
+    A set of strings that may answer "yes" for strings that were never
+    added, but never answers "no" for ones that were.
+    '''
+
+    def __init__(self, size, hashes, bits=None):
+        self.size = size
+        self.hashes = hashes
+        if bits is None:
+            bits = bytearray((size + 7) // 8)
+        self.bits = bits
+
+    @classmethod
+    def for_capacity(cls, count, error_rate=0.01, max_bytes=None):
+        '''
+        Returns an empty filter sized for count strings at the given false
+        positive rate, or as close to it as max_bytes allows.
+        '''
+
+        count = max(count, 1)
+        size = math.ceil(-count * math.log(error_rate) / math.log(2) ** 2)
+        if max_bytes:
+            size = min(size, max_bytes * 8)
+        hashes = max(1, round(size / count * math.log(2)))
+
+        return cls(size, hashes)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            magic, size, hashes = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(path+' is not a bloom filter')
+            return cls(size, hashes, bytearray(f.read()))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.size, self.hashes))
+            f.write(self.bits)
+
+    def _positions(self, string):
+        digest = hashlib.blake2b(string.encode('utf-8'), digest_size=16)
+        h1, h2 = struct.unpack('<QQ', digest.digest())
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, string):
+        for pos in self._positions(string):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, string):
+        return all(
+            self.bits[pos >> 3] & 1 << (pos & 7)
+            for pos in self._positions(string)
+        )
+
+    def error_rate(self, count):
+        ''' Returns the expected false positive rate with count strings. '''
+
+        return (1 - math.exp(-self.hashes * count / self.size)) ** self.hashes
@@ -0,0 +1,101 @@
+'''
+Kanjibot -- a reddit bot that posts information about kanji
+Copyright (C) 2017  Vojtech Balak
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import os
+import socket
+import sqlite3
+import time
+
+
+class ClaimStore:
+    '''
+    Lets several bot processes share one inbox. Each mention is claimed by
+    exactly one worker. A claim that isn't completed before its lease runs
+    out (because the worker crashed) can be taken over by another worker.
+    '''
+
+    def __init__(self, path, lease=300, worker=None):
+        self.path = path
+        self.lease = lease
+        if worker is None:
+            worker = socket.gethostname()+':'+str(os.getpid())
+        self.worker = worker
+        self.cnx = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.cnx.execute(
+            'CREATE TABLE IF NOT EXISTS `claim` ('
+            '  `mention_id` TEXT PRIMARY KEY,'
+            '  `worker` TEXT NOT NULL,'
+            '  `expires` REAL NOT NULL,'
+            '  `done` INTEGER NOT NULL DEFAULT 0'
+            ')'
+        )
+
+    def claim(self, mention_id):
+        ''' Returns True if this worker should answer the mention. '''
+
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock up front, so the check and
+        # the update can't interleave with another worker's.
+        self.cnx.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = self.cnx.execute(
+                'INSERT OR IGNORE INTO `claim`'
+                ' (`mention_id`, `worker`, `expires`) VALUES (?, ?, ?)',
+                (mention_id, self.worker, now + self.lease)
+            )
+            if cursor.rowcount == 0:
+                cursor = self.cnx.execute(
+                    'UPDATE `claim` SET `worker` = ?, `expires` = ?'
+                    ' WHERE `mention_id` = ? AND `done` = 0'
+                    ' AND (`expires` < ? OR `worker` = ?)',
+                    (self.worker, now + self.lease, mention_id, now,
+                     self.worker)
+                )
+            claimed = cursor.rowcount == 1
+            self.cnx.execute('COMMIT')
+        except sqlite3.Error:
+            self.cnx.execute('ROLLBACK')
+            raise
+
+        return claimed
+
+    def complete(self, mention_id):
+        ''' Marks a claimed mention as answered. '''
+
+        self.cnx.execute(
+            'UPDATE `claim` SET `done` = 1'
+            ' WHERE `mention_id` = ? AND `worker` = ?',
+            (mention_id, self.worker)
+        )
+
+    def release(self, mention_id):
+        ''' Gives up a claim so that another worker can retry it. '''
+
+        self.cnx.execute(
+            'DELETE FROM `claim`'
+            ' WHERE `mention_id` = ? AND `worker` = ? AND `done` = 0',
+            (mention_id, self.worker)
+        )
+
+    def purge(self, age=7*24*3600):
+        ''' Forgets mentions answered more than age seconds ago. '''
+
+        self.cnx.execute(
+            'DELETE FROM `claim` WHERE `done` = 1 AND `expires` < ?',
+            (time.time() - age,)
+        )
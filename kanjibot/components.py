@@ -0,0 +1,143 @@
+'''
+Kanjibot -- a reddit bot that posts information about kanji
+Copyright (C) 2017  Vojtech Balak
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import unicodedata
+
+# KRADFILE only uses JIS X 0208 characters, so elements that are not in it
+# are written as a kanji containing them (see the notes in the kradfile).
+# This maps the forms users write to those stand-ins. 阝 is on the left in
+# 阡 and on the right in 邦, written alone it could be either.
+VARIANTS = {
+    '亻': ('化',), '⺅': ('化',),
+    '𠆢': ('个',),
+    '刂': ('刈',), '⺉': ('刈',),
+    '辶': ('込',), '⻌': ('込',), '⻍': ('込',), '⻎': ('込',),
+    '⺌': ('尚',), '⺍': ('尚',),
+    '忄': ('忙',), '⺖': ('忙',),
+    '扌': ('扎',), '⺘': ('扎',),
+    '氵': ('汁',), '⺡': ('汁',),
+    '犭': ('犯',), '⺨': ('犯',),
+    '艹': ('艾',), '⺾': ('艾',), '⺿': ('艾',), '⻀': ('艾',),
+    '⻏': ('邦',), '⻖': ('阡',), '阝': ('阡', '邦'),
+    '⺹': ('老',),
+    '灬': ('杰',), '⺣': ('杰',),
+    '礻': ('礼',), '⺭': ('礼',),
+    '疒': ('疔',),
+    '禸': ('禹',),
+    '衤': ('初',), '⻂': ('初',),
+    '罒': ('買',), '⺲': ('買',), '⺫': ('買',),
+    '啇': ('滴',),
+    '丨': ('｜',),
+}
+STAND_INS = {s for stand_ins in VARIANTS.values() for s in stand_ins}
+
+
+class ComponentIndex:
+    '''
+    Maps each KRADFILE component to a bitset of the kanji containing it.
+    Kanji are numbered by frequency, so walking the set bits of an
+    intersection from the lowest one yields the most common kanji first.
+    '''
+
+    def __init__(self, rows):
+        '''
+        Builds the index from (character, frequency, component) rows,
+        as returned by Database.get_kanji_components().
+        '''
+
+        frequency = {}
+        components = {}
+        for character, freq, component in rows:
+            frequency[character] = freq
+            components.setdefault(character, set()).add(component)
+
+        # Kanji without a frequency rank go after all ranked ones.
+        self.kanji = sorted(
+            frequency,
+            key=lambda k: (frequency[k] is None, frequency[k] or 0, k)
+        )
+        self.bits = {}
+        for i, character in enumerate(self.kanji):
+            for component in components[character]:
+                self.bits[component] = self.bits.get(component, 0) | 1 << i
+        # A stand-in written by the user means the kanji itself, not every
+        # kanji with the element it stands for.
+        self.stand_ins = {
+            character: components[character]
+            for character in STAND_INS if character in components
+        }
+
+    def _get_bits(self, component):
+        '''
+        Returns the bitset of kanji containing a component as written by
+        the user, or None if the component is unknown.
+        '''
+
+        if component in self.stand_ins:
+            result = -1
+            for part in self.stand_ins[component]:
+                result &= self.bits[part]
+            return result
+        if component in self.bits:
+            return self.bits[component]
+        # Kangxi radicals like ⼝ are compatibility forms of kanji.
+        component = unicodedata.normalize('NFKC', component)
+        if component in self.bits:
+            return self.bits[component]
+        stand_ins = [s for s in VARIANTS.get(component, ()) if s in self.bits]
+        if not stand_ins:
+            return None
+        result = 0
+        for stand_in in stand_ins:
+            result |= self.bits[stand_in]
+        return result
+
+    def __contains__(self, component):
+        return self._get_bits(component) is not None
+
+    def search(self, components, limit=None):
+        '''
+        Returns kanji that contain all of the given components,
+        most frequent first.
+        '''
+
+        if not components:
+            return []
+        result = -1
+        for component in components:
+            result &= self._get_bits(component) or 0
+            if not result:
+                return []
+
+        found = []
+        while result and (limit is None or len(found) < limit):
+            low = result & -result
+            found.append(self.kanji[low.bit_length() - 1])
+            result ^= low
+        return found
+
+    def count(self, components):
+        ''' Returns the number of kanji containing all given components. '''
+
+        if not components:
+            return 0
+        result = -1
+        for component in components:
+            result &= self._get_bits(component) or 0
+        return bin(result).count('1')
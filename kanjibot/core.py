@@ -16,37 +16,199 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
-import base64
-import json
 import configparser
 import os.path
 import re
-import requests
-import praw
-import prawcore
+import time
+import unicodedata
 import urllib
 from io import BytesIO
-from PIL import Image
-from PIL import ImageDraw
-from PIL import ImageFont
 
+from kanjibot import components
 from kanjibot import database
+from kanjibot import deinflect
+from kanjibot import diagnostics
+from kanjibot import ratelimit
+
+# Seconds between inbox polls while nothing new comes in, the longest
+# backoff praw's own stream uses.
+IDLE_POLL_INTERVAL = 16
+
+# Services are created on first use, so that importing this module stays
+# cheap and each command only pays for what it needs. Reddit, imgur and
+# PIL modules are likewise imported inside the functions that use them.
+config = None
+db = None
+imgur_client = None
+fonts = None
+component_index = None
+claims = None
+scheduler = None
+reddit = None
+assets = None
+
+
+def get_config():
+    ''' Reads kanjibot.ini on first use and returns the bot's section. '''
+
+    global config
+    if config is None:
+        config = configparser.ConfigParser()
+        config.read('kanjibot.ini')
+    return config['kanji-bot']
+
+
+def get_db():
+    ''' Returns the database, it connects when first queried. '''
+
+    global db
+    if db is None:
+        db = database.Database(
+            get_config()['db_host'],
+            get_config()['db_name'],
+            get_config()['db_user'],
+            get_config()['db_password'],
+            get_config().get('word_storage', 'normalized') == 'compact'
+        )
+        path = get_config().get('word_filter', '')
+        if path and os.path.isfile(path):
+            db.load_word_filter(path)
+    return db
+
+
+def get_imgur_client():
+    ''' Returns the imgur client shared by all uploads. '''
+
+    global imgur_client
+    if imgur_client is None:
+        from kanjibot import imgur
+        imgur_client = imgur.ImgurClient(
+            get_config()['imgur_id'],
+            url=get_config().get('imgur_url', 'https://api.imgur.com/3/image'),
+            timeout=get_config().getfloat('imgur_timeout', 10),
+            retries=get_config().getint('imgur_retries', 3),
+            pause=lambda seconds: get_scheduler().pause('imgur', seconds)
+        )
+    return imgur_client
+
+
+def get_scheduler():
+    ''' Returns the rate limiter shared by all reddit and imgur requests. '''
+
+    global scheduler
+    if scheduler is None:
+        scheduler = ratelimit.Scheduler()
+        scheduler.add_service(
+            'reddit', get_config().getint('reddit_requests_per_minute', 30)
+        )
+        scheduler.add_service(
+            'imgur', get_config().getint('imgur_uploads_per_minute', 20)
+        )
+    return scheduler
+
+
+def get_assets():
+    '''
+    Returns the bundle of prerendered images built by --build-assets,
+    or None if there isn't one.
+    '''
+
+    global assets
+    path = get_config().get('asset_bundle', '')
+    if assets is None and path and os.path.isfile(path):
+        from kanjibot import assets as asset_bundle
+        assets = asset_bundle.AssetBundle(path)
+    return assets
+
+
+def get_reddit():
+    '''
+    Returns the reddit client. It is kept across restarts of
+    reply_to_mentions, so that errors don't pile up new clients.
+    '''
+
+    global reddit
+    if reddit is None:
+        import praw
+        reddit = praw.Reddit('kanji-bot')
+    return reddit
+
+
+def get_claim_store():
+    '''
+    Returns the store that several bot processes use to decide which of
+    them answers a mention, or None when running alone.
+    '''
+
+    global claims
+    if claims is None and get_config().get('claim_db', ''):
+        from kanjibot import claims as claim_store
+        claims = claim_store.ClaimStore(
+            get_config()['claim_db'],
+            get_config().getfloat('claim_lease', 300)
+        )
+    return claims
+
 
+def get_fonts():
+    ''' Loads the fonts used for previews once and returns them. '''
 
-config = configparser.ConfigParser()
-config.read('kanjibot.ini')
-db = database.Database(
-    config['kanji-bot']['db_host'],
-    config['kanji-bot']['db_name'],
-    config['kanji-bot']['db_user'],
-    config['kanji-bot']['db_password'],
-)
+    global fonts
+    if fonts is None:
+        from PIL import ImageFont
+        fonts = [
+            ImageFont.truetype("jp-data/fonts/IPAexfont/ipaexg.ttf", 200),
+            ImageFont.truetype("jp-data/fonts/IPAexfont/ipaexm.ttf", 200),
+            ImageFont.truetype("jp-data/fonts/nagayama_kai08.otf", 200),
+            ImageFont.truetype("jp-data/fonts/SNsanafon/SNsanafon.ttf", 200),
+        ]
+    return fonts
 
 
 def init_database():
     ''' Fills the database with data. Should be run only once. '''
 
-    db.fill_database()
+    get_db().fill_database()
+    path = get_config().get('word_filter', '')
+    if path:
+        get_db().build_word_filter(
+            path,
+            get_config().getfloat('word_filter_error_rate', 0.01),
+            get_config().getint('word_filter_max_bytes', 0)
+        )
+
+
+def build_assets(processes=None):
+    ''' Prerenders images of all kanji in the database into a bundle. '''
+
+    from kanjibot import assets as asset_bundle
+
+    kanji_list = get_db().get_all_kanji()
+    # The workers only render, they must not inherit the db connection.
+    get_db().close()
+    asset_bundle.build(
+        get_config().get('asset_bundle', 'jp-data/assets.bundle'),
+        kanji_list,
+        processes
+    )
+
+
+def print_storage_stats(layout=None):
+    '''
+    Prints how the two word storage layouts compare. Lookups are only
+    timed for the given layout, or for both if it is None.
+    '''
+
+    stats = get_db().get_storage_stats(layout)
+    for name, s in sorted(stats.items()):
+        line = (
+            name+': '
+            + str(s['data_size'] // 1024)+' KiB data, '
+            + str(s['index_size'] // 1024)+' KiB indexes'
+        )
+        if s['lookup_time'] is not None:
+            line += ', {:.2f} ms per lookup'.format(s['lookup_time'] * 1000)
+        print(line)
 
 
 def is_kanji(character):
@@ -91,64 +253,140 @@ def contains_japanese(text):
     return any(is_kanji(char) or is_kana(char) for char in text)
 
 
-def upload_to_imgur(image, title=None):
-    ''' Uploads an image to imgur and returns its URL. '''
+def upload_to_imgur(image, title=None, deadline=None):
+    '''
+    Uploads PNG data to imgur and returns its URL. Images are optional,
+    so None is returned if the upload can't be done before deadline,
+    a time.monotonic() value.
+    '''
 
-    client_id = config['kanji-bot']['imgur_id']
-    url = 'https://api.imgur.com/3/image'
-    response = requests.post(
-        url,
-        headers={'Authorization': 'Client-ID '+client_id},
-        data={
-            'image': image,
-            'type': 'base64',
-            'title': title
-        }
-    )
-    response_data = json.loads(response.text)
-    if response_data['success']:
-        return response_data['data']['link']
-    else:
-        print('Imgur upload failed!')
+    if not get_scheduler().acquire('imgur', deadline):
+        print('Imgur rate limit reached, skipping image')
         return None
+    link = get_imgur_client().upload(image, title, deadline)
+    if link is None:
+        print('Imgur upload failed!')
+    return link
 
 
-def get_preview_image_url(kanji):
-    ''' Uploads kanji image to imgur and returns its url. '''
+def render_preview(kanji):
+    ''' Returns an image of the kanji written in several fonts. '''
+
+    from PIL import Image
+    from PIL import ImageDraw
 
     image = Image.new("RGBA", (1000, 250), (255, 255, 255))
     draw = ImageDraw.Draw(image)
 
-    ipag = ImageFont.truetype("jp-data/fonts/IPAexfont/ipaexg.ttf", 200)
-    ipam = ImageFont.truetype("jp-data/fonts/IPAexfont/ipaexm.ttf", 200)
-    nagayama = ImageFont.truetype("jp-data/fonts/nagayama_kai08.otf", 200)
-    sanafon = ImageFont.truetype("jp-data/fonts/SNsanafon/SNsanafon.ttf", 200)
+    for i, font in enumerate(get_fonts()):
+        draw.text((25 + i*250, 25), kanji, (0, 0, 0), font=font)
+
+    return image
+
+
+def get_stroke_image_path(kanji):
+    ''' Returns path to the stroke order image or None if there isn't one. '''
+
+    path = 'jp-data/strokes/'+kanji+'.png'
+    if os.path.isfile(path):
+        return path
+    else:
+        return None
+
+
+def has_stroke_image(kanji):
+    return get_stroke_png(kanji) is not None
 
-    draw.text((25, 25), kanji, (0, 0, 0), font=ipag)
-    draw.text((275, 25), kanji, (0, 0, 0), font=ipam)
-    draw.text((525, 25), kanji, (0, 0, 0), font=nagayama)
-    draw.text((775, 25), kanji, (0, 0, 0), font=sanafon)
+
+def get_preview_png(kanji):
+    ''' Returns the preview image as PNG data, prerendered if possible. '''
+
+    bundle = get_assets()
+    if bundle is not None:
+        png = bundle.get(kanji, 'preview')
+        if png is not None:
+            return png
 
     buff = BytesIO()
-    image.save(buff, format="PNG")
-    img_base64 = base64.b64encode(buff.getvalue())
+    with diagnostics.stage('render'):
+        render_preview(kanji).save(buff, format="PNG")
+    return buff.getvalue()
 
-    return upload_to_imgur(img_base64, kanji+' preview')
 
+def get_stroke_png(kanji):
+    ''' Returns the stroke order image as PNG data or None. '''
 
-def get_stroke_image_url(kanji):
-    ''' Uploads kanji stroke order image to imgur and returns its url. '''
+    bundle = get_assets()
+    if bundle is not None:
+        png = bundle.get(kanji, 'stroke')
+        if png is not None:
+            return png
 
-    path = 'jp-data/strokes/'+kanji+'.png'
-    if os.path.isfile(path):
+    path = get_stroke_image_path(kanji)
+    if path is not None:
         with open(path, 'rb') as f:
-            img = f.read()
-            img_base64 = base64.b64encode(img)
-            return upload_to_imgur(img_base64, kanji+' stroke order')
+            return f.read()
+    else:
+        return None
+
+
+def get_preview_image_url(kanji, deadline=None):
+    ''' Uploads kanji image to imgur and returns its url. '''
+
+    return upload_to_imgur(
+        get_preview_png(kanji), kanji+' preview', deadline
+    )
+
+
+def get_stroke_image_url(kanji, deadline=None):
+    ''' Uploads kanji stroke order image to imgur and returns its url. '''
+
+    img = get_stroke_png(kanji)
+    if img is not None:
+        return upload_to_imgur(img, kanji+' stroke order', deadline)
     else:
         return None
 
 
+def get_composite_image_url(kanji_list, deadline=None):
+    '''
+    Renders previews and stroke order images of all the kanji into one
+    image, one row per kanji, and uploads it to imgur. Returns its url.
+    '''
+
+    from PIL import Image
+
+    with diagnostics.stage('render'):
+        row_height = 250
+        rows = []
+        for kanji in kanji_list:
+            preview = Image.open(BytesIO(get_preview_png(kanji)))
+            stroke = None
+            img = get_stroke_png(kanji)
+            if img is not None:
+                with Image.open(BytesIO(img)) as img:
+                    width = img.width * row_height // img.height
+                    stroke = img.convert('RGBA').resize((width, row_height))
+            rows.append((preview.convert('RGBA'), stroke))
+
+        width = max(
+            preview.width + (stroke.width if stroke is not None else 0)
+            for preview, stroke in rows
+        )
+        image = Image.new(
+            "RGBA", (width, row_height * len(rows)), (255, 255, 255)
+        )
+        for i, (preview, stroke) in enumerate(rows):
+            image.paste(preview, (0, i * row_height))
+            if stroke is not None:
+                image.paste(stroke, (preview.width, i * row_height), stroke)
+
+        buff = BytesIO()
+        image.save(buff, format="PNG")
+
+    return upload_to_imgur(buff.getvalue(), ' '.join(kanji_list), deadline)
+
+
 def get_kanji_search_links(kanji):
     links = '^^[\[jisho\]](http://jisho.org/search/'
     links += urllib.parse.quote_plus(kanji+'#kanji')+')'
@@ -165,16 +403,17 @@ def get_kanji_search_links(kanji):
     return links
 
 
-def get_kanji_info(kanji):
+def get_kanji_info(kanji, composite_url=None, upload_images=True,
+                   deadline=None):
     '''
     Returns a markdown block with information about the specified kanji.
-    Will also upload a stroke order image to imgur.
+    Will also upload a preview and a stroke order image to imgur, unless
+    composite_url points to an image that already contains them or
+    upload_images is False. Images that can't be uploaded before deadline
+    are left out.
     '''
 
-    data = db.get_kanji_data(kanji)
-
-    comment = '##['+kanji+']('+get_preview_image_url(kanji)+')'
-    comment += ' '+get_kanji_search_links(kanji)+'\n\n'
+    data = get_db().get_kanji_data(kanji)
 
     if data is None:
         return (
@@ -182,6 +421,18 @@ def get_kanji_info(kanji):
             + get_kanji_search_links(kanji)
         )
 
+    if composite_url is not None:
+        preview = composite_url
+    elif upload_images:
+        preview = get_preview_image_url(kanji, deadline)
+    else:
+        preview = None
+    if preview is not None:
+        comment = '##['+kanji+']('+preview+')'
+    else:
+        comment = '##'+kanji
+    comment += ' '+get_kanji_search_links(kanji)+'\n\n'
+
     comment += '**Meaning:** '
     comment += ', '.join(data['meaning'])+'  \n'
 
@@ -208,7 +459,15 @@ def get_kanji_info(kanji):
         parts_info.append('**Components:** '+' '.join(data['components']))
     comment += ' '.join(parts_info)
 
-    img = get_stroke_image_url(kanji)
+    if composite_url is None:
+        if upload_images:
+            img = get_stroke_image_url(kanji, deadline)
+        else:
+            img = None
+    elif has_stroke_image(kanji):
+        img = composite_url
+    else:
+        img = None
     if img is not None:
         comment += ' [Stroke Order]('+img+')'
 
@@ -234,12 +493,14 @@ def get_word_search_links(word):
     return links
 
 
-def get_word_info(word):
+def get_word_info(word, inflection=None):
     '''
-    Returns a markdown block with information about the specified kanji.
+    Returns a markdown block with information about the specified word.
+    The inflection is a dict returned by find_word and is shown
+    if the word was written in a conjugated form.
     '''
 
-    data = db.get_word_data(word)
+    data = get_db().get_word_data(word)
     if data is None:
         return (
             '##Couldn\'t find data for word \''
@@ -266,6 +527,11 @@ def get_word_info(word):
             reading_info = '**Reading:** '
             reading_info += '、'.join(readings)
             info.append(reading_info)
+        if inflection and inflection['reasons']:
+            info.append(
+                '**Inflection:** '+inflection['text']
+                + ' _('+' '.join(inflection['reasons'])+')_'
+            )
         if info:
             comment += '  \n'.join(info)+'\n\n'
 
@@ -283,66 +549,352 @@ def get_word_info(word):
     return '\n\n---\n\n'.join(comments)
 
 
+def get_component_index():
+    ''' Builds the component index on first use. '''
+
+    global component_index
+    if component_index is None:
+        component_index = components.ComponentIndex(
+            get_db().get_kanji_components()
+        )
+    return component_index
+
+
+def get_parts_info(parts, limit=50):
+    '''
+    Returns a markdown block listing kanji that contain all the specified
+    components.
+    '''
+
+    index = get_component_index()
+    unknown = [p for p in parts if p not in index]
+    if unknown:
+        return '##Unknown component \''+'\', \''.join(unknown)+'\''
+
+    found = index.search(parts, limit)
+    if not found:
+        return '##No kanji contain '+' '.join(parts)
+
+    comment = '##Kanji with '+' '.join(parts)+'\n\n'
+    comment += ' '.join(
+        '['+k+'](http://jisho.org/search/'
+        + urllib.parse.quote_plus(k+'#kanji')+')'
+        for k in found
+    )
+    total = index.count(parts)
+    if total > len(found):
+        comment += ' _(and '+str(total-len(found))+' more)_'
+
+    return comment
+
+
+def get_meaning_info(query, limit=10):
+    '''
+    Returns a markdown block with kanji and words whose English meaning
+    matches the query.
+    '''
+
+    data = get_db().search_meaning(query, limit)
+    if not data['kanji'] and not data['words']:
+        return '##Couldn\'t find anything meaning \''+query+'\''
+
+    comment = '##Meaning: '+query+'\n\n'
+    info = []
+    if data['kanji']:
+        info.append('**Kanji:** '+' '.join(
+            '['+k+'](http://jisho.org/search/'
+            + urllib.parse.quote_plus(k+'#kanji')+')'
+            for k in data['kanji']
+        ))
+    if data['words']:
+        words = []
+        for w in data['words']:
+            link = '['+w['word']+'](http://jisho.org/search/'
+            link += urllib.parse.quote_plus(w['word'])+')'
+            if w['reading'] and w['reading'] != w['word']:
+                link += ' ('+w['reading']+')'
+            words.append(link)
+        info.append('**Words:** '+'、'.join(words))
+    comment += '  \n'.join(info)
+
+    return comment
+
+
+def find_word(text):
+    '''
+    Looks for the dictionary form of a possibly inflected word, see
+    deinflect.find.
+    '''
+
+    return deinflect.find(text, get_db().find_words)
+
+
 def parse_line(line):
-    ''' Extracts kanji and words from a line of text. '''
+    '''
+    Extracts kanji, words, component searches and meaning searches
+    from a line of text.
+    '''
 
     delimiters = '[\s,、]+'
     parts = re.split(delimiters, line)
 
-    found = {'kanji': [], 'words': []}
-    kanji_mode = False
-    word_mode = False
+    found = {
+        'kanji': [],
+        'words': [],
+        'parts': [],
+        'meanings': [],
+        'inflections': []
+    }
+    commands = {
+        '!kanji': 'kanji',
+        '!word': 'word',
+        '!words': 'word',
+        '!parts': 'parts',
+        '!meaning': 'meaning'
+    }
+    mode = None
     for word in parts:
+        if word in commands:
+            mode = commands[word]
+            if mode == 'meaning':
+                found['meanings'].append([])
+            continue
+        if mode == 'meaning' and word and 'u/' not in word:
+            found['meanings'][-1].append(word)
+            continue
+        if mode == 'parts' and any(ord(c) > 127 for c in word):
+            # Components are not necessarily kanji (e.g. ノ or 亻), but
+            # punctuation like 。 is no component.
+            group = [
+                c for c in word
+                if not unicodedata.category(c).startswith('P')
+            ]
+            if group:
+                found['parts'].append(group)
+            continue
         if not contains_japanese(word):
-            if word == '!kanji':
-                kanji_mode = True
-                word_mode = False
-            elif word == '!word' or word == '!words':
-                word_mode = True
-                kanji_mode = False
             continue
 
-        if kanji_mode or (
-                not word_mode and (not db.is_word(word) or len(word) == 1)
-        ):
+        kanji_mode = mode == 'kanji'
+        word_mode = mode == 'word'
+        if kanji_mode or (not word_mode and len(word) == 1):
             found['kanji'] = found['kanji'] + extract_kanji(word)
-        else:
+            continue
+
+        match = find_word(word)
+        if match is not None:
+            found['words'].append(match['word'])
+            found['inflections'].append(match)
+        elif word_mode:
             found['words'].append(word)
+            found['inflections'].append(None)
+        else:
+            found['kanji'] = found['kanji'] + extract_kanji(word)
 
     return found
 
 
-def reply_to_mentions():
-    ''' Continuously reads reddit mentions and replies to them. '''
+def build_reply(found, upload_images=True):
+    '''
+    Returns markdown with information about everything parse_line found.
+    With the composite_images option, all kanji share a single upload.
+    All uploads of a reply share one time budget for waiting on the imgur
+    rate limit, the images that don't fit are left out.
+    '''
+
+    deadline = time.monotonic() + get_config().getfloat(
+        'image_time_budget', 10
+    )
+    composite_url = None
+    if upload_images and found['kanji'] and get_config().getboolean(
+            'composite_images', False
+    ):
+        composite_url = get_composite_image_url(found['kanji'], deadline)
+        # Don't fall back to one upload per kanji if the composite failed.
+        upload_images = False
+
+    info = [
+        get_kanji_info(k, composite_url, upload_images, deadline)
+        for k in found['kanji']
+    ]
+    info += [
+        get_word_info(w, inflection)
+        for w, inflection in zip(found['words'], found['inflections'])
+    ]
+    info += [get_parts_info(p) for p in found['parts']]
+    info += [get_meaning_info(' '.join(m)) for m in found['meanings'] if m]
 
-    account = config['kanji-bot']['reddit_account']
-    footer = config['kanji-bot']['footer']
-    reddit = praw.Reddit('kanji-bot')
+    return '\n\n---\n\n'.join(info)
 
-    print('Connected to reddit, waiting for summons...')
-    for mention in reddit.inbox.stream():
-        for i in range(3):
+
+def get_replies(text, upload_images=True, all_lines=False):
+    '''
+    Returns a reply for each line of a comment that summons the bot,
+    or for every line with anything to answer if all_lines is set.
+    '''
+
+    account = get_config()['reddit_account']
+    footer = get_config()['footer']
+
+    replies = []
+    for line in text.split('\n'):
+        if all_lines or 'u/'+account in line:
+            with diagnostics.stage('parse'):
+                found = parse_line(line)
+            if any(found[k] for k in ('kanji', 'words', 'parts', 'meanings')):
+                with diagnostics.stage('reply'):
+                    comment = build_reply(found, upload_images)
+                comment += '\n\n---\n\n'+footer
+                replies.append(comment)
+
+    return replies
+
+
+def get_ratelimit_delay(exception):
+    '''
+    Returns the seconds reddit asks to wait in a RATELIMIT error,
+    e.g. "Take a break for 9 minutes before trying again.", or None if
+    the exception doesn't contain one.
+    '''
+
+    units = {'second': 1, 'minute': 60, 'hour': 3600}
+    for item in exception.items:
+        if item.error_type != 'RATELIMIT':
+            continue
+        match = re.search(r'(\d+) (second|minute|hour)', item.message)
+        if match is None:
+            return 60
+        return int(match.group(1)) * units[match.group(2)]
+    return None
+
+
+def send_reply(mention, comment, attempts=3):
+    '''
+    Replies to a mention, waiting for the reddit rate limit and backing
+    off when reddit reports it is overloaded or over quota. Returns True
+    on success.
+    '''
+
+    import praw
+    import prawcore
+
+    for i in range(attempts):
+        get_scheduler().acquire('reddit')
+        # A long wait may outlast the claim, don't reply if another worker
+        # has taken the mention over meanwhile.
+        if i > 0 and get_claim_store() is not None and \
+                not get_claim_store().claim(mention.id):
+            print('Mention '+mention.id+' was taken over by another worker')
+            return False
+        try:
+            print('Sending response...', end='')
+            mention.reply(comment)
+            print(' done')
+            return True
+        except praw.exceptions.RedditAPIException as e:
+            print(e)
+            delay = get_ratelimit_delay(e)
+            if delay is None:
+                return False
+            get_scheduler().pause('reddit', delay)
+        except prawcore.exceptions.RequestException as e:
+            print(e)
+            get_scheduler().pause('reddit', 5 * 2**i)
+        except prawcore.exceptions.ResponseException as e:
+            print(e)
+            status = e.response.status_code
+            if status != 429 and status < 500:
+                return False
+            delay = e.response.headers.get('Retry-After', 5 * 2**i)
             try:
-                print('Reading mention by /u/'+mention.author.name, end='')
-                if hasattr(mention.subreddit, 'display_name'):
-                    print(' in /r/'+mention.subreddit.display_name)
-                else:
-                    print()
-                for line in mention.body.split('\n'):
-                    if 'u/'+account in line:
-                        found = parse_line(line)
-                        if found['kanji'] or found['words']:
-                            print('Sending response...', end='')
-                            info = [get_kanji_info(k) for k in found['kanji']]
-                            info += [get_word_info(w) for w in found['words']]
-                            comment = '\n\n---\n\n'.join(info)
-                            comment += '\n\n---\n\n'+footer
-                            mention.reply(comment)
-                            print(' done')
-                        else:
-                            print('No kanji found')
-                break
-            except prawcore.exceptions.RequestException as e:
-                print(e)
+                get_scheduler().pause('reddit', float(delay))
+            except ValueError:
+                get_scheduler().pause('reddit', 5 * 2**i)
+
+    return False
 
+
+def answer_mention(mention):
+    '''
+    Replies to a mention and marks it as read. If anything fails before
+    that, the claim on it is released so that it can be answered again.
+    '''
+
+    claim_store = get_claim_store()
+    try:
+        print('Reading mention by /u/'+mention.author.name, end='')
+        if hasattr(mention.subreddit, 'display_name'):
+            print(' in /r/'+mention.subreddit.display_name)
+        else:
+            print()
+        replies = get_replies(mention.body)
+        if not replies:
+            print('No kanji found')
+        for comment in replies:
+            send_reply(mention, comment)
+
+        get_scheduler().acquire('reddit')
         mention.mark_read()
+    except Exception:
+        if claim_store is not None:
+            claim_store.release(mention.id)
+        raise
+
+    if claim_store is not None:
+        claim_store.complete(mention.id)
+    print('Rate limits: '+get_scheduler().report())
+    if imgur_client is not None and imgur_client.upload_count:
+        print(
+            'Imgur: '+str(imgur_client.upload_count)+' uploads, '
+            + '{:.2f}s average'.format(imgur_client.average_latency())
+        )
+
+
+def sweep_claims(reddit):
+    '''
+    Answers unread mentions that were released or whose worker died
+    before answering them, and forgets old claims.
+    '''
+
+    claim_store = get_claim_store()
+    for mention in reddit.inbox.unread(limit=None):
+        if claim_store.claim(mention.id):
+            print('Taking over mention '+mention.id)
+            answer_mention(mention)
+    claim_store.purge()
+
+
+def reply_to_mentions():
+    ''' Continuously reads reddit mentions and replies to them. '''
+
+    if get_config().get('diagnostics_file', ''):
+        diagnostics.start(
+            get_config()['diagnostics_file'],
+            get_config().getfloat('diagnostics_interval', 3600)
+        )
+
+    reddit = get_reddit()
+    claim_store = get_claim_store()
+    last_sweep = time.time()
+
+    print('Connected to reddit, waiting for summons...')
+    if claim_store is None:
+        for mention in reddit.inbox.stream():
+            answer_mention(mention)
+        return
+
+    # With pause_after=0 the stream yields None after every poll that
+    # found nothing instead of backing off, which gives a chance to look
+    # for mentions other workers left unanswered. The wait between polls
+    # is then up to us.
+    for mention in reddit.inbox.stream(pause_after=0):
+        if mention is None:
+            if time.time() - last_sweep > claim_store.lease:
+                sweep_claims(reddit)
+                last_sweep = time.time()
+            time.sleep(IDLE_POLL_INTERVAL)
+            continue
+        if not claim_store.claim(mention.id):
+            print('Mention '+mention.id+' is handled by another worker')
+            continue
+        answer_mention(mention)
@@ -17,29 +17,103 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+import json
+import random
+import re
+import time
+import unicodedata
+import zlib
 import xml.etree.ElementTree as ET
 import mysql.connector
 
+from kanjibot import bloom
+
+
+def normalize_reading(reading):
+    ''' Folds katakana to hiragana so that readings can be compared. '''
+
+    return ''.join(
+        chr(ord(c) - 0x60) if '\u30a1' <= c <= '\u30f6' else c
+        for c in reading
+    )
+
+
+SMALL_KANA = str.maketrans('ぁぃぅぇぉっゃゅょゎゕゖ', 'あいうえおつやゆよわかけ')
+
+
+def filter_key(string):
+    '''
+    Folds a string the way utf8mb4_unicode_ci compares it, as far as it
+    matters for Japanese and English: width, case, voicing marks and
+    accents, small kana and katakana. Used for the word filter, whose keys
+    have to match at least everything the wording lookup matches.
+    '''
+
+    string = ''.join(
+        c for c in unicodedata.normalize('NFKD', string)
+        if unicodedata.category(c) != 'Mn'
+    )
+    return normalize_reading(string.casefold()).translate(SMALL_KANA)
+
+
+def priority_score(tags):
+    '''
+    Turns a list of JMdict ke_pri/re_pri tags into a single number.
+    Higher means more common. The 'nfXX' tags rank words by frequency
+    in 500 word bands, the rest mark words found in common word lists.
+    '''
+
+    score = 0
+    for tag in tags:
+        nf = re.match(r'nf(\d+)$', tag)
+        if nf:
+            score += 50 - int(nf.group(1))
+        elif tag.endswith('1'):
+            score += 100
+        elif tag.endswith('2'):
+            score += 50
+    return score
+
 
 class Database:
     '''
     This class is used to import and retrieve language data to/from the db.
     '''
 
-    def __init__(self, host, db_name, user, password):
+    def __init__(self, host, db_name, user, password, compact_words=False):
+        self.host = host
+        self.db_name = db_name
+        self.user = user
+        self.password = password
+        self.cnx = None
+        self.word_filter = None
+        self.compact_words = compact_words
+
+    def _connect(self):
+        self.cnx = mysql.connector.connect(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            database=self.db_name,
+            use_unicode=True,
+            charset='utf8mb4'
+        )
+
+    def close(self):
+        if self.cnx is not None:
+            self.cnx.close()
+            self.cnx = None
+
+    def close_quietly(self):
+        ''' Drops a connection that may already be broken. '''
+
         try:
-            self.cnx = mysql.connector.connect(
-                user=user,
-                password=password,
-                host=host,
-                database=db_name,
-                use_unicode=True,
-                charset='utf8mb4'
-            )
-        except mysql.connector.Error as err:
-            print(err)
+            self.close()
+        except mysql.connector.Error:
+            pass
+        self.cnx = None
 
-    def _get_cursor(self):
+    def _set_charset(self):
         cursor = self.cnx.cursor()
         cursor.execute('SET NAMES utf8mb4')
         cursor.execute("SET CHARACTER SET utf8mb4")
@@ -47,6 +121,26 @@ class Database:
 
         return cursor
 
+    def _get_cursor(self):
+        '''
+        Opens the connection on first use. If it was lost, e.g. during a db
+        outage, the first statement fails and the connection is reopened
+        once, so no extra round trip is spent checking it beforehand.
+        '''
+
+        if self.cnx is None:
+            self._connect()
+            return self._set_charset()
+        try:
+            return self._set_charset()
+        except (
+                mysql.connector.errors.OperationalError,
+                mysql.connector.errors.InterfaceError
+        ):
+            self.close_quietly()
+            self._connect()
+            return self._set_charset()
+
     def _create_tables(self):
         tables = [
             (
@@ -113,6 +207,7 @@ class Database:
                 'CREATE TABLE `word_entry` ('
                 '  `word_entry_id` int(11) NOT NULL AUTO_INCREMENT,'
                 '  `sequence_number` int(11) NOT NULL,'
+                '  `priority` int(11) NOT NULL DEFAULT 0,'
                 '  PRIMARY KEY (`word_entry_id`)'
                 ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'
                 ' COLLATE=utf8mb4_unicode_ci;'
@@ -124,6 +219,7 @@ class Database:
                 '  `text` text COLLATE utf8mb4_unicode_ci NOT NULL,'
                 '  PRIMARY KEY (`wew_id`),'
                 '  KEY `word_entry_id` (`word_entry_id`),'
+                '  KEY `text` (`text`(64)),'
                 '  CONSTRAINT `word_entry_wording_ibfk_2`'
                 '  FOREIGN KEY (`word_entry_id`)'
                 '  REFERENCES `word_entry` (`word_entry_id`)'
@@ -147,8 +243,11 @@ class Database:
                 '  `wer_id` int(11) NOT NULL AUTO_INCREMENT,'
                 '  `word_entry_id` int(11) NOT NULL,'
                 '  `reading` text COLLATE utf8mb4_unicode_ci NOT NULL,'
+                '  `reading_key` varchar(191) COLLATE utf8mb4_bin NOT NULL,'
+                '  `priority` int(11) NOT NULL DEFAULT 0,'
                 '  PRIMARY KEY (`wer_id`),'
                 '  KEY `word_entry_id` (`word_entry_id`),'
+                '  KEY `reading_key` (`reading_key`, `priority`),'
                 '  CONSTRAINT `word_entry_reading_ibfk_2`'
                 '  FOREIGN KEY (`word_entry_id`)'
                 '  REFERENCES `word_entry` (`word_entry_id`)'
@@ -167,6 +266,28 @@ class Database:
                 ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'
                 ' COLLATE=utf8mb4_unicode_ci;'
             ),
+            (
+                'CREATE TABLE `wew_priority` ('
+                '  `wew_id` int(11) NOT NULL,'
+                '  `tag` varchar(10) COLLATE utf8mb4_unicode_ci NOT NULL,'
+                '  KEY `wew_id` (`wew_id`),'
+                '  CONSTRAINT `wew_priority_ibfk_1` FOREIGN KEY (`wew_id`)'
+                '  REFERENCES `word_entry_wording` (`wew_id`)'
+                '  ON DELETE CASCADE ON UPDATE CASCADE'
+                ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'
+                ' COLLATE=utf8mb4_unicode_ci;'
+            ),
+            (
+                'CREATE TABLE `wer_priority` ('
+                '  `wer_id` int(11) NOT NULL,'
+                '  `tag` varchar(10) COLLATE utf8mb4_unicode_ci NOT NULL,'
+                '  KEY `wer_id` (`wer_id`),'
+                '  CONSTRAINT `wer_priority_ibfk_1` FOREIGN KEY (`wer_id`)'
+                '  REFERENCES `word_entry_reading` (`wer_id`)'
+                '  ON DELETE CASCADE ON UPDATE CASCADE'
+                ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'
+                ' COLLATE=utf8mb4_unicode_ci;'
+            ),
             (
                 'CREATE TABLE `word_entry_meaning` ('
                 '  `wem_id` int(11) NOT NULL AUTO_INCREMENT,'
@@ -213,6 +334,28 @@ class Database:
                 ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'
                 ' COLLATE=utf8mb4_unicode_ci;'
             ),
+            (
+                'CREATE TABLE `word_record` ('
+                '  `sequence_number` int(11) NOT NULL,'
+                '  `data` mediumblob NOT NULL,'
+                '  PRIMARY KEY (`sequence_number`)'
+                ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'
+                ' COLLATE=utf8mb4_unicode_ci;'
+            ),
+            (
+                'CREATE TABLE `word_key` ('
+                '  `text` varchar(191) COLLATE utf8mb4_bin NOT NULL,'
+                '  `kind` tinyint(1) NOT NULL,'
+                '  `sequence_number` int(11) NOT NULL,'
+                '  `priority` int(11) NOT NULL DEFAULT 0,'
+                '  `entry_priority` int(11) NOT NULL DEFAULT 0,'
+                '  KEY `text` (`text`, `kind`, `priority`),'
+                '  CONSTRAINT `word_key_ibfk_1` FOREIGN KEY'
+                '  (`sequence_number`) REFERENCES `word_record`'
+                '  (`sequence_number`) ON DELETE CASCADE ON UPDATE CASCADE'
+                ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'
+                ' COLLATE=utf8mb4_unicode_ci;'
+            ),
             (
                 'CREATE TABLE `wem_part_of_speech` ('
                 '  `wem_id` int(11) NOT NULL,'
@@ -368,6 +511,7 @@ class Database:
                 (seq,)
             )
             entry_id = cursor.lastrowid
+            entry_priority = 0
             for k in entry.iter('k_ele'):
                 wording = k.find('keb').text
                 cursor.execute(
@@ -384,13 +528,29 @@ class Database:
                         'VALUES (%s, %s)',
                         (wording_id, info.text)
                     )
+                tags = [pri.text for pri in k.iter('ke_pri')]
+                for tag in tags:
+                    cursor.execute(
+                        'INSERT INTO `wew_priority`'
+                        '(`wew_id`, `tag`)'
+                        'VALUES (%s, %s)',
+                        (wording_id, tag)
+                    )
+                entry_priority = max(entry_priority, priority_score(tags))
             for r in entry.iter('r_ele'):
                 reading = r.find('reb').text
+                tags = [pri.text for pri in r.iter('re_pri')]
+                reading_priority = priority_score(tags)
                 cursor.execute(
                     'INSERT INTO `word_entry_reading`'
-                    '(`word_entry_id`, `reading`)'
-                    'VALUES (%s, %s)',
-                    (entry_id, reading)
+                    '(`word_entry_id`, `reading`, `reading_key`, `priority`)'
+                    'VALUES (%s, %s, %s, %s)',
+                    (
+                        entry_id,
+                        reading,
+                        normalize_reading(reading),
+                        reading_priority
+                    )
                 )
                 reading_id = cursor.lastrowid
                 for info in r.iter('re_inf'):
@@ -400,6 +560,20 @@ class Database:
                         'VALUES (%s, %s)',
                         (reading_id, info.text)
                     )
+                for tag in tags:
+                    cursor.execute(
+                        'INSERT INTO `wer_priority`'
+                        '(`wer_id`, `tag`)'
+                        'VALUES (%s, %s)',
+                        (reading_id, tag)
+                    )
+                entry_priority = max(entry_priority, reading_priority)
+            cursor.execute(
+                'UPDATE `word_entry` SET `priority` = %s'
+                ' WHERE `word_entry_id` = %s',
+                (entry_priority, entry_id)
+            )
+            self._store_word_record(cursor, seq, entry, entry_priority)
             for sense in entry.iter('sense'):
                 cursor.execute(
                     'INSERT INTO `word_entry_meaning`'
@@ -440,6 +614,59 @@ class Database:
             self.cnx.commit()
         cursor.close()
 
+    def _store_word_record(self, cursor, seq, entry, entry_priority):
+        '''
+        Stores a JMdict entry as a single compressed record, together with
+        the keys it can be looked up by. This is the compact alternative to
+        the word_entry_* tables.
+        '''
+
+        record = {'wording': [], 'reading': [], 'meaning': []}
+        keys = []
+        for k in entry.iter('k_ele'):
+            wording = k.find('keb').text
+            record['wording'].append({
+                'text': wording,
+                'info': [info.text for info in k.iter('ke_inf')]
+            })
+            tags = [pri.text for pri in k.iter('ke_pri')]
+            keys.append((wording, 0, priority_score(tags)))
+        for r in entry.iter('r_ele'):
+            reading = r.find('reb').text
+            record['reading'].append({
+                'text': reading,
+                'info': [info.text for info in r.iter('re_inf')]
+            })
+            tags = [pri.text for pri in r.iter('re_pri')]
+            keys.append((normalize_reading(reading), 1, priority_score(tags)))
+        for sense in entry.iter('sense'):
+            record['meaning'].append({
+                'pos': [pos.text for pos in sense.iter('pos')],
+                'field': [field.text for field in sense.iter('field')],
+                'gloss': [gloss.text for gloss in sense.iter('gloss')],
+                'misc': [misc.text for misc in sense.iter('misc')]
+            })
+
+        data = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        cursor.execute(
+            'INSERT INTO `word_record` (`sequence_number`, `data`)'
+            'VALUES (%s, %s)',
+            (seq, zlib.compress(data.encode('utf-8'), 9))
+        )
+        # The same key can appear twice, e.g. a katakana and a hiragana
+        # reading, only the better ranked one is needed.
+        best = {}
+        for text, kind, priority in keys:
+            if best.get((text, kind), -1) < priority:
+                best[(text, kind)] = priority
+        for (text, kind), priority in best.items():
+            cursor.execute(
+                'INSERT INTO `word_key` (`text`, `kind`, `sequence_number`,'
+                ' `priority`, `entry_priority`)'
+                'VALUES (%s, %s, %s, %s, %s)',
+                (text, kind, seq, priority, entry_priority)
+            )
+
     def fill_database(self):
         ''' Fills an empty database with language data. '''
 
@@ -447,6 +674,73 @@ class Database:
         self._load_radicals()
         self._load_kanji()
         self._load_words()
+        self._create_search_indexes()
+
+    def _create_search_indexes(self):
+        '''
+        Adds full-text indexes for meaning searches and prefix indexes for
+        the exact match used when the full-text search finds nothing.
+        Building them after the data is loaded is much faster than updating
+        them on every insert.
+        '''
+
+        indexes = [
+            'ALTER TABLE `kanji_meaning`'
+            ' ADD FULLTEXT KEY `meaning_text` (`meaning`)',
+            'ALTER TABLE `wem_gloss`'
+            ' ADD FULLTEXT KEY `gloss_text` (`text`)',
+            'ALTER TABLE `kanji_meaning`'
+            ' ADD KEY `meaning` (`meaning`(32))',
+            'ALTER TABLE `wem_gloss`'
+            ' ADD KEY `text` (`text`(32))'
+        ]
+        cursor = self._get_cursor()
+        for index in indexes:
+            try:
+                cursor.execute(index)
+            except mysql.connector.Error as err:
+                print(err)
+        cursor.close()
+
+    def build_word_filter(self, path, error_rate=0.01, max_bytes=None):
+        '''
+        Saves a bloom filter of all wordings and reading keys to path,
+        used by is_word and find_words to skip queries for non-words.
+        '''
+
+        cursor = self._get_cursor()
+        cursor.execute(
+            'SELECT `text` FROM `word_entry_wording`'
+            ' UNION '
+            'SELECT `reading_key` FROM `word_entry_reading`'
+        )
+        keys = [row[0] for row in cursor]
+        cursor.close()
+
+        word_filter = bloom.BloomFilter.for_capacity(
+            len(keys), error_rate, max_bytes
+        )
+        for key in keys:
+            word_filter.add(filter_key(key))
+        word_filter.save(path)
+        print(
+            'Word filter: '+str(len(word_filter.bits))+' bytes, '
+            + '{:.2%}'.format(word_filter.error_rate(len(keys)))
+            + ' false positives'
+        )
+        self.word_filter = word_filter
+
+    def load_word_filter(self, path):
+        ''' Loads a filter saved by build_word_filter. '''
+
+        self.word_filter = bloom.BloomFilter.load(path)
+
+    def _maybe_word(self, string):
+        ''' False only if the string is certainly not a word. '''
+
+        if self.word_filter is None:
+            return True
+        return filter_key(string) in self.word_filter
 
     def get_kanji_data(self, kanji):
         ''' Returns a dict with info about a kanji. '''
@@ -507,7 +801,195 @@ class Database:
         cursor.close()
         return data
 
-    def get_word_data(self, word):
+    def _find_by_reading(self, cursor, reading, limit):
+        ''' Returns ids of the most common entries with the given reading. '''
+
+        cursor.execute(
+            'SELECT `word_entry_id`'
+            ' FROM `word_entry_reading`'
+            ' JOIN `word_entry` USING (`word_entry_id`)'
+            ' WHERE `reading_key` = %s'
+            ' GROUP BY `word_entry_id`'
+            ' ORDER BY MAX(`word_entry_reading`.`priority`) DESC,'
+            '          MAX(`word_entry`.`priority`) DESC,'
+            '          `word_entry_id`'
+            ' LIMIT %s',
+            (normalize_reading(reading), limit)
+        )
+        return list(cursor)
+
+    def get_all_kanji(self):
+        ''' Returns a list of all kanji characters, most frequent first. '''
+
+        cursor = self._get_cursor()
+        cursor.execute(
+            'SELECT `character` FROM `kanji`'
+            ' ORDER BY `frequency` IS NULL, `frequency`, `kanji_id`'
+        )
+        kanji = [row[0] for row in cursor]
+        cursor.close()
+
+        return kanji
+
+    def get_kanji_components(self):
+        '''
+        Returns (character, frequency, component) rows for every kanji
+        that has components.
+        '''
+
+        cursor = self._get_cursor()
+        cursor.execute(
+            'SELECT `kanji`.`character`, `frequency`,'
+            '       `kanji_component`.`character`'
+            ' FROM `kanji` JOIN `kanji_component` USING (`kanji_id`)'
+        )
+        rows = list(cursor)
+        cursor.close()
+
+        return rows
+
+    def search_meaning(self, query, limit=10):
+        '''
+        Returns a dict with kanji and words whose English meaning matches
+        the query, best matches first.
+        '''
+
+        cursor = self._get_cursor()
+        cursor.execute(
+            'SELECT `character`,'
+            '       MAX(MATCH (`meaning`) AGAINST (%s)) AS `score`'
+            ' FROM `kanji_meaning` JOIN `kanji` USING (`kanji_id`)'
+            ' WHERE MATCH (`meaning`) AGAINST (%s)'
+            ' GROUP BY `kanji_id`, `character`, `frequency`'
+            ' ORDER BY `score` DESC, `frequency` IS NULL, `frequency`'
+            ' LIMIT %s',
+            (query, query, limit)
+        )
+        data = {'kanji': [row[0] for row in cursor], 'words': []}
+        if not data['kanji']:
+            # Words shorter than innodb_ft_min_token_size and stopwords
+            # are not in the full-text index, try them as a whole meaning.
+            cursor.execute(
+                'SELECT DISTINCT `character`, `frequency`'
+                ' FROM `kanji_meaning` JOIN `kanji` USING (`kanji_id`)'
+                ' WHERE `meaning` = %s'
+                ' ORDER BY `frequency` IS NULL, `frequency`'
+                ' LIMIT %s',
+                (query, limit)
+            )
+            data['kanji'] = [row[0] for row in cursor]
+
+        cursor.execute(
+            'SELECT `word_entry_id`,'
+            '       MAX(MATCH (`text`) AGAINST (%s)) AS `score`'
+            ' FROM `wem_gloss`'
+            ' JOIN `word_entry_meaning` USING (`wem_id`)'
+            ' JOIN `word_entry` USING (`word_entry_id`)'
+            ' WHERE MATCH (`text`) AGAINST (%s)'
+            ' GROUP BY `word_entry_id`, `priority`'
+            ' ORDER BY `score` DESC, `priority` DESC'
+            ' LIMIT %s',
+            (query, query, limit)
+        )
+        entry_ids = [row[0] for row in cursor]
+        if not entry_ids:
+            cursor.execute(
+                'SELECT DISTINCT `word_entry_id`, `priority`'
+                ' FROM `wem_gloss`'
+                ' JOIN `word_entry_meaning` USING (`wem_id`)'
+                ' JOIN `word_entry` USING (`word_entry_id`)'
+                ' WHERE `wem_gloss`.`text` = %s'
+                ' ORDER BY `priority` DESC'
+                ' LIMIT %s',
+                (query, limit)
+            )
+            entry_ids = [row[0] for row in cursor]
+        if not entry_ids:
+            cursor.close()
+            return data
+
+        placeholders = ', '.join(['%s']*len(entry_ids))
+        words = {}
+        cursor.execute(
+            'SELECT `word_entry_id`, `text` FROM `word_entry_wording`'
+            ' WHERE `word_entry_id` IN ('+placeholders+')'
+            ' ORDER BY `wew_id`',
+            entry_ids
+        )
+        for entry_id, text in cursor:
+            words.setdefault(entry_id, {'word': text, 'reading': None})
+        cursor.execute(
+            'SELECT `word_entry_id`, `reading` FROM `word_entry_reading`'
+            ' WHERE `word_entry_id` IN ('+placeholders+')'
+            ' ORDER BY `wer_id`',
+            entry_ids
+        )
+        for entry_id, reading in cursor:
+            word = words.setdefault(
+                entry_id, {'word': reading, 'reading': None}
+            )
+            if word['reading'] is None:
+                word['reading'] = reading
+        cursor.close()
+
+        data['words'] = [words[i] for i in entry_ids if i in words]
+        return data
+
+    def _get_compact_word_data(self, word, limit):
+        ''' Same as get_word_data, but reads the compact word records. '''
+
+        cursor = self._get_cursor()
+        cursor.execute(
+            '(SELECT `kind`, `priority`, `entry_priority`,'
+            '        `sequence_number`, `data`'
+            '  FROM `word_key` JOIN `word_record` USING (`sequence_number`)'
+            '  WHERE `text` = %s AND `kind` = 0)'
+            ' UNION ALL '
+            '(SELECT `kind`, `priority`, `entry_priority`,'
+            '        `sequence_number`, `data`'
+            '  FROM `word_key` JOIN `word_record` USING (`sequence_number`)'
+            '  WHERE `text` = %s AND `kind` = 1'
+            '  ORDER BY `priority` DESC, `entry_priority` DESC,'
+            '           `sequence_number`'
+            '  LIMIT %s)'
+            ' ORDER BY `kind`, `priority` DESC, `entry_priority` DESC,'
+            '          `sequence_number`',
+            (word, normalize_reading(word), limit)
+        )
+        rows = list(cursor)
+        cursor.close()
+        if not rows:
+            return None
+
+        # Exact wordings win over readings, like in get_word_data.
+        by_reading = rows[0][0] == 1
+        data = []
+        for kind, _, _, _, blob in rows:
+            if kind == 1 and not by_reading:
+                break
+            record = json.loads(zlib.decompress(blob).decode('utf-8'))
+            word_data = {'word': word}
+            if by_reading and record['wording']:
+                word_data['word'] = record['wording'][0]['text']
+            word_data['alt_wording'] = [
+                w for w in record['wording'] if w['text'] != word_data['word']
+            ]
+            word_data['reading'] = record['reading']
+            word_data['meaning'] = record['meaning']
+            data.append(word_data)
+
+        return data
+
+    def get_word_data(self, word, limit=3):
+        '''
+        Returns a list of dicts with info about entries matching a word.
+        Words written in kana match by reading, in which case only
+        the `limit` most common entries are returned.
+        '''
+
+        if self.compact_words:
+            return self._get_compact_word_data(word, limit)
+
         cursor = self._get_cursor()
         cursor.execute(
             'SELECT `word_entry_id`'
@@ -516,15 +998,10 @@ class Database:
             (word,)
         )
         rows = list(cursor)
-        if not rows:
-            cursor.execute(
-                'SELECT `word_entry_id`'
-                ' FROM `word_entry_reading`'
-                ' WHERE `reading` = %s',
-                (word,)
-            )
-            rows = list(cursor)
-            if len(rows) != 1:
+        by_reading = not rows
+        if by_reading:
+            rows = self._find_by_reading(cursor, word, limit)
+            if not rows:
                 return None
 
         data = []
@@ -536,9 +1013,13 @@ class Database:
                 ' WHERE `word_entry_id` = %s',
                 (entry_id,)
             )
+            wordings = list(cursor)
+            if by_reading and wordings:
+                # Homophones are told apart by their usual written form.
+                word_data['word'] = wordings[0][1]
             word_data['alt_wording'] = []
-            for alt in list(cursor):
-                if alt[1] != word:
+            for alt in wordings:
+                if alt[1] != word_data['word']:
                     alt_wording = {'text': alt[1]}
                     cursor.execute(
                         'SELECT `text` FROM `wew_info`'
@@ -604,20 +1085,113 @@ class Database:
         return data
 
     def is_word(self, string):
-        cursor = self._get_cursor()
+        if not self._maybe_word(string):
+            return False
 
+        cursor = self._get_cursor()
         cursor.execute(
-            'SELECT * FROM `word_entry_wording`'
-            ' WHERE `text` = %s',
+            'SELECT 1 FROM `word_entry_wording`'
+            ' WHERE `text` = %s LIMIT 1',
             (string,)
         )
         result = bool(list(cursor))
+        if not result:
+            cursor.execute(
+                'SELECT 1 FROM `word_entry_reading`'
+                ' WHERE `reading_key` = %s LIMIT 1',
+                (normalize_reading(string),)
+            )
+            result = bool(list(cursor))
+        cursor.close()
+
+        return result
+
+    def find_words(self, strings):
+        '''
+        Returns the subset of strings that are dictionary words,
+        checking all of them with a single query.
+        '''
+
+        strings = [s for s in strings if self._maybe_word(s)]
+        if not strings:
+            return set()
+        keys = [normalize_reading(s) for s in strings]
+        cursor = self._get_cursor()
         cursor.execute(
-            'SELECT * FROM `word_entry_reading`'
-            ' WHERE `reading` = %s',
-            (string,)
+            'SELECT `text` FROM `word_entry_wording`'
+            ' WHERE `text` IN ('+', '.join(['%s']*len(strings))+')'
+            ' UNION '
+            'SELECT `reading_key` FROM `word_entry_reading`'
+            ' WHERE `reading_key` IN ('+', '.join(['%s']*len(keys))+')',
+            strings+keys
         )
-        result = len(list(cursor)) == 1 or result
+        found = {row[0] for row in cursor}
         cursor.close()
 
-        return result
+        return {
+            s for s, key in zip(strings, keys) if s in found or key in found
+        }
+
+    def get_storage_stats(self, layout=None, sample_size=200, seed=0):
+        '''
+        Compares the normalized word tables with the compact word records.
+        Returns their size in bytes and, for the given layout or both, the
+        average get_word_data time in seconds over a sample of words.
+        The sample is picked by random ids with a fixed seed, so that it
+        is the same in every run and picking it doesn't read either
+        layout's tables. Timing each layout in its own run keeps one from
+        warming up the cache for the other.
+        '''
+
+        layouts = {
+            'normalized': [
+                'word_entry', 'word_entry_wording', 'wew_info',
+                'wew_priority', 'word_entry_reading', 'wer_info',
+                'wer_priority', 'word_entry_meaning', 'wem_field',
+                'wem_gloss', 'wem_misc', 'wem_part_of_speech'
+            ],
+            'compact': ['word_record', 'word_key']
+        }
+        stats = {}
+        compact_words = self.compact_words
+        cursor = self._get_cursor()
+        cursor.execute('SELECT MAX(`wew_id`) FROM `word_entry_wording`')
+        max_id = list(cursor)[0][0] or 0
+        ids = random.Random(seed).sample(
+            range(1, max_id + 1), min(sample_size, max_id)
+        )
+        sample = []
+        if ids:
+            cursor.execute(
+                'SELECT `text` FROM `word_entry_wording`'
+                ' WHERE `wew_id` IN ('+', '.join(['%s']*len(ids))+')',
+                ids
+            )
+            sample = [row[0] for row in cursor]
+        for name, tables in layouts.items():
+            cursor.execute(
+                'SELECT SUM(`data_length`), SUM(`index_length`)'
+                ' FROM `information_schema`.`tables`'
+                ' WHERE `table_schema` = %s AND `table_name` IN ('
+                + ', '.join(['%s']*len(tables))+')',
+                [self.db_name]+tables
+            )
+            data_size, index_size = list(cursor)[0]
+            stats[name] = {
+                'data_size': int(data_size or 0),
+                'index_size': int(index_size or 0),
+                'lookup_time': None
+            }
+            if layout is not None and layout != name:
+                continue
+
+            self.compact_words = name == 'compact'
+            start = time.perf_counter()
+            for word in sample:
+                self.get_word_data(word)
+            elapsed = time.perf_counter() - start
+            stats[name]['lookup_time'] = elapsed / max(len(sample), 1)
+        self.compact_words = compact_words
+        cursor.close()
+
+        return stats
@@ -0,0 +1,212 @@
+'''
+Kanjibot -- a reddit bot that posts information about kanji
+Copyright (C) 2017  Vojtech Balak
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Word types. A rule only applies to a form of one of its input types and
+# produces a form of its output type. The text as written by the user can
+# be of any type. Only forms of the dictionary types are worth looking up.
+V1 = 1         # ichidan verb
+V5 = 2         # godan verb
+VK = 4         # kuru
+VS = 8         # suru
+ADJ_I = 16     # i-adjective, also negative and -tai forms
+MASU = 32      # polite stem + ます
+TE = 64        # te-form
+WORD = 128     # noun left after removing する
+FINAL = 256    # forms that don't inflect any further
+
+ANY = V1 | V5 | VK | VS | ADJ_I | MASU | TE | WORD | FINAL
+DICTIONARY = V1 | V5 | VK | VS | ADJ_I | WORD
+
+GODAN_ROWS = {
+    # u: (a, i, e, o, te, ta)
+    'う': ('わ', 'い', 'え', 'お', 'って', 'った'),
+    'く': ('か', 'き', 'け', 'こ', 'いて', 'いた'),
+    'ぐ': ('が', 'ぎ', 'げ', 'ご', 'いで', 'いだ'),
+    'す': ('さ', 'し', 'せ', 'そ', 'して', 'した'),
+    'つ': ('た', 'ち', 'て', 'と', 'って', 'った'),
+    'ぬ': ('な', 'に', 'ね', 'の', 'んで', 'んだ'),
+    'ぶ': ('ば', 'び', 'べ', 'ぼ', 'んで', 'んだ'),
+    'む': ('ま', 'み', 'め', 'も', 'んで', 'んだ'),
+    'る': ('ら', 'り', 'れ', 'ろ', 'って', 'った'),
+}
+
+
+def _build_rules():
+    ''' Returns a list of (from, to, input types, output type, reason). '''
+
+    rules = [
+        # Chained endings, their stems are handled by the rules below.
+        ('ました', 'ます', ANY, MASU, 'past'),
+        ('ません', 'ます', ANY, MASU, 'negative'),
+        ('ませんでした', 'ます', ANY, MASU, 'negative past'),
+        ('ましょう', 'ます', ANY, MASU, 'volitional'),
+        ('まして', 'ます', ANY, MASU, 'te-form'),
+        ('ている', 'て', V1, TE, 'progressive'),
+        ('てる', 'て', V1, TE, 'progressive'),
+        ('でいる', 'で', V1, TE, 'progressive'),
+        ('でる', 'で', V1, TE, 'progressive'),
+        ('てしまう', 'て', V5, TE, 'completion'),
+        ('でしまう', 'で', V5, TE, 'completion'),
+        ('てください', 'て', ANY, TE, 'request'),
+        ('でください', 'で', ANY, TE, 'request'),
+
+        # i-adjectives (and everything that inflects like them)
+        ('かった', 'い', ANY, ADJ_I, 'past'),
+        ('くない', 'い', ADJ_I, ADJ_I, 'negative'),
+        ('くて', 'い', ANY, ADJ_I, 'te-form'),
+        ('ければ', 'い', ANY, ADJ_I, 'conditional'),
+        ('かったら', 'い', ANY, ADJ_I, 'conditional'),
+        ('く', 'い', ANY, ADJ_I, 'adverb'),
+        ('さ', 'い', ANY, ADJ_I, 'noun'),
+
+        # ichidan verbs
+        ('ない', 'る', ADJ_I, V1, 'negative'),
+        ('ず', 'る', ANY, V1, 'negative'),
+        ('た', 'る', ANY, V1, 'past'),
+        ('たら', 'る', ANY, V1, 'conditional'),
+        ('て', 'る', TE | FINAL, V1, 'te-form'),
+        ('ます', 'る', MASU, V1, 'polite'),
+        ('たい', 'る', ADJ_I, V1, 'desire'),
+        ('られる', 'る', V1, V1, 'passive'),
+        ('れる', 'る', V1, V1, 'potential'),
+        ('させる', 'る', V1, V1, 'causative'),
+        ('よう', 'る', ANY, V1, 'volitional'),
+        ('れば', 'る', ANY, V1, 'conditional'),
+        ('ろ', 'る', ANY, V1, 'imperative'),
+
+        # kuru
+        ('こない', 'くる', ADJ_I, VK, 'negative'),
+        ('きた', 'くる', ANY, VK, 'past'),
+        ('きて', 'くる', TE | FINAL, VK, 'te-form'),
+        ('きます', 'くる', MASU, VK, 'polite'),
+        ('きたい', 'くる', ADJ_I, VK, 'desire'),
+        ('こられる', 'くる', V1, VK, 'passive'),
+        ('こさせる', 'くる', V1, VK, 'causative'),
+        ('こよう', 'くる', ANY, VK, 'volitional'),
+        ('くれば', 'くる', ANY, VK, 'conditional'),
+        ('こい', 'くる', ANY, VK, 'imperative'),
+
+        # suru
+        ('しない', 'する', ADJ_I, VS, 'negative'),
+        ('した', 'する', ANY, VS, 'past'),
+        ('して', 'する', TE | FINAL, VS, 'te-form'),
+        ('します', 'する', MASU, VS, 'polite'),
+        ('したい', 'する', ADJ_I, VS, 'desire'),
+        ('される', 'する', V1, VS, 'passive'),
+        ('させる', 'する', V1, VS, 'causative'),
+        ('できる', 'する', V1, VS, 'potential'),
+        ('しよう', 'する', ANY, VS, 'volitional'),
+        ('すれば', 'する', ANY, VS, 'conditional'),
+        ('しろ', 'する', ANY, VS, 'imperative'),
+        ('する', '', VS, WORD, 'suru verb'),
+
+        # 行く is the one irregular godan verb
+        ('って', 'く', TE | FINAL, V5, 'te-form'),
+        ('った', 'く', ANY, V5, 'past'),
+    ]
+
+    for u, (a, i, e, o, te, ta) in GODAN_ROWS.items():
+        rules += [
+            (a+'ない', u, ADJ_I, V5, 'negative'),
+            (a+'ず', u, ANY, V5, 'negative'),
+            (a+'れる', u, V1, V5, 'passive'),
+            (a+'せる', u, V1, V5, 'causative'),
+            (i+'ます', u, MASU, V5, 'polite'),
+            (i+'たい', u, ADJ_I, V5, 'desire'),
+            (e+'る', u, V1, V5, 'potential'),
+            (e+'ば', u, ANY, V5, 'conditional'),
+            (e, u, ANY, V5, 'imperative'),
+            (o+'う', u, ANY, V5, 'volitional'),
+            (te, u, TE | FINAL, V5, 'te-form'),
+            (ta, u, ANY, V5, 'past'),
+            (ta+'ら', u, ANY, V5, 'conditional'),
+        ]
+
+    return rules
+
+
+RULES = _build_rules()
+
+
+def deinflect(word, max_depth=4):
+    '''
+    Returns possible dictionary forms of a word as a list of dicts
+    with the form and the inflections leading to it, outermost last.
+    The word itself comes first, shorter chains before longer ones.
+    Most forms are not real words, the caller has to check them.
+    '''
+
+    candidates = [{'word': word, 'type': ANY, 'reasons': []}]
+    seen = {(word, ANY)}
+    i = 0
+    while i < len(candidates):
+        candidate = candidates[i]
+        i += 1
+        if len(candidate['reasons']) >= max_depth:
+            continue
+        text = candidate['word']
+        for suffix, ending, types_in, type_out, reason in RULES:
+            if not candidate['type'] & types_in:
+                continue
+            if not text.endswith(suffix):
+                continue
+            form = text[:-len(suffix)]+ending
+            if not form or (form, type_out) in seen:
+                continue
+            seen.add((form, type_out))
+            candidates.append({
+                'word': form,
+                'type': type_out,
+                'reasons': [reason]+candidate['reasons']
+            })
+
+    # Fewer inflections first. With as many inflections, a verb is more
+    # likely than a noun left after cutting off a する that wasn't one.
+    candidates.sort(
+        key=lambda c: (len(c['reasons']), c['type'] == WORD)
+    )
+    result = []
+    forms = set()
+    for candidate in candidates:
+        if candidate['type'] & DICTIONARY and candidate['word'] not in forms:
+            forms.add(candidate['word'])
+            result.append({
+                'word': candidate['word'],
+                'reasons': candidate['reasons']
+            })
+    return result
+
+
+def find(word, lookup):
+    '''
+    Returns the first possible dictionary form of a word that lookup
+    knows, as a dict with the form, the original text and the inflections
+    leading to it, or None. lookup is called once with all candidates and
+    returns the set of those that are dictionary words.
+    '''
+
+    candidates = deinflect(word)
+    words = lookup([c['word'] for c in candidates])
+    for candidate in candidates:
+        if candidate['word'] in words:
+            return {
+                'word': candidate['word'],
+                'text': word,
+                'reasons': candidate['reasons']
+            }
+    return None
@@ -0,0 +1,155 @@
+'''
+Kanjibot -- a reddit bot that posts information about kanji
+Copyright (C) 2017  Vojtech Balak
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import collections
+import contextlib
+import gc
+import resource
+import signal
+import threading
+import time
+import tracemalloc
+
+# The running monitor, stage() does nothing until one is started.
+monitor = None
+
+
+class MemoryMonitor:
+    '''
+    Writes memory reports to a file: the allocations that grew the most
+    since the previous report, object counts per type and memory growth
+    per stage of the bot. A report is written every interval seconds and
+    whenever the process gets SIGUSR1.
+    '''
+
+    def __init__(self, path, interval=0, frames=10, top=15):
+        self.path = path
+        self.interval = interval
+        self.frames = frames
+        self.top = top
+        self.lock = threading.Lock()
+        self.requested = threading.Event()
+        self.local = threading.local()
+        self.snapshot = None
+        self.type_counts = collections.Counter()
+        self.stages = {}
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        self.snapshot = tracemalloc.take_snapshot()
+        self.type_counts = self._count_types()
+        # The handler may interrupt the main thread while it holds the lock,
+        # so it only wakes up the reporting thread.
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(
+                signal.SIGUSR1, lambda signum, frame: self.requested.set()
+            )
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def _run(self):
+        while True:
+            requested = self.requested.wait(self.interval or None)
+            self.requested.clear()
+            self.report('signal' if requested else 'interval')
+
+    def _count_types(self):
+        return collections.Counter(type(o).__name__ for o in gc.get_objects())
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        Attributes memory growth to a stage of the bot. Growth in a nested
+        stage only counts for the inner one.
+        '''
+
+        stack = self.local.__dict__.setdefault('stack', [])
+        stack.append(0)
+        memory = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            memory = tracemalloc.get_traced_memory()[0] - memory
+            nested = stack.pop()
+            if stack:
+                stack[-1] += memory
+            with self.lock:
+                stats = self.stages.setdefault(
+                    name, {'calls': 0, 'memory': 0}
+                )
+                stats['calls'] += 1
+                stats['memory'] += memory - nested
+
+    def report(self, reason):
+        ''' Appends a report to the file and starts a new period. '''
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__)
+        ])
+        type_counts = self._count_types()
+        with self.lock:
+            previous, self.snapshot = self.snapshot, snapshot
+            previous_counts, self.type_counts = self.type_counts, type_counts
+            stages, self.stages = self.stages, {}
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            '=== '+time.strftime('%Y-%m-%d %H:%M:%S')+' ('+reason+')',
+            'max RSS: '+str(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            )+' KiB, traced: '+str(current // 1024)+' KiB, '
+            + 'traced peak: '+str(peak // 1024)+' KiB',
+            '--- top allocation growth'
+        ]
+        for stat in snapshot.compare_to(previous, 'lineno')[:self.top]:
+            lines.append(str(stat))
+
+        lines.append('--- object count growth per type')
+        type_counts.subtract(previous_counts)
+        for name, count in type_counts.most_common(self.top):
+            if count <= 0:
+                break
+            lines.append(name+': +'+str(count))
+
+        lines.append('--- growth per stage')
+        for name, stats in sorted(stages.items()):
+            lines.append(
+                name+': '+str(stats['calls'])+' calls, '
+                + str(stats['memory'] // 1024)+' KiB'
+            )
+
+        with open(self.path, 'a') as f:
+            f.write('\n'.join(lines)+'\n\n')
+
+
+def start(path, interval=0):
+    ''' Starts the memory monitor unless it already runs. '''
+
+    global monitor
+    if monitor is None:
+        monitor = MemoryMonitor(path, interval)
+        monitor.start()
+    return monitor
+
+
+def stage(name):
+    ''' Context manager measuring a stage when the monitor runs. '''
+
+    if monitor is None:
+        return contextlib.nullcontext()
+    return monitor.stage(name)
@@ -0,0 +1,179 @@
+'''
+Kanjibot -- a reddit bot that posts information about kanji
+Copyright (C) 2017  Vojtech Balak
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class ImgurClient:
+    '''
+    Uploads images to imgur over a pooled keep-alive session.
+    The client is safe to share between threads. When imgur answers 429,
+    the Retry-After delay is passed to pause, if given, instead of being
+    waited out here.
+    '''
+
+    def __init__(self, client_id, url='https://api.imgur.com/3/image',
+                 timeout=10, retries=3, backoff=0.5, pool_size=4,
+                 min_remaining=10, pause=None):
+        self.client_id = client_id
+        self.url = url
+        self.timeout = timeout
+        self.min_remaining = min_remaining
+        self.pause = pause
+
+        # 429 isn't retried, Retry-After can be minutes and urllib3 would
+        # sleep through all of it.
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['POST']),
+            respect_retry_after_header=False,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Authorization'] = 'Client-ID '+client_id
+
+        self._lock = threading.Lock()
+        self.remaining = None
+        self.reset = None
+        self.upload_count = 0
+        self.upload_time = 0.0
+
+    def _read_rate_limit(self, headers):
+        '''
+        Remembers the most restrictive limit reported by imgur. Only limits
+        with a known reset time can be throttled against. The client limit
+        comes without one, it is a daily limit so the next midnight UTC is
+        assumed.
+        '''
+
+        limits = []
+        for remaining, reset in (
+                ('X-Post-Rate-Limit-Remaining', 'X-Post-Rate-Limit-Reset'),
+                ('X-RateLimit-UserRemaining', 'X-RateLimit-UserReset'),
+                ('X-RateLimit-ClientRemaining', None)
+        ):
+            if remaining not in headers:
+                continue
+            try:
+                left = int(headers[remaining])
+                if reset is None:
+                    now = time.time()
+                    until = now - now % 86400 + 86400
+                elif reset not in headers:
+                    continue
+                # Post limit resets are relative, user resets are epoch time.
+                elif reset.startswith('X-Post'):
+                    until = time.time() + int(headers[reset])
+                else:
+                    until = int(headers[reset])
+            except ValueError:
+                continue
+            limits.append((left, until))
+
+        if limits:
+            with self._lock:
+                self.remaining, self.reset = min(
+                    limits, key=lambda limit: limit[0]
+                )
+
+    def _throttle(self, deadline=None):
+        '''
+        Spreads the remaining uploads over the time left until the limit
+        resets once we are close to running out. Returns False without
+        waiting if that would take until after deadline.
+        '''
+
+        with self._lock:
+            remaining, reset = self.remaining, self.reset
+        if remaining is None or reset is None:
+            return True
+        if remaining >= self.min_remaining:
+            return True
+        delay = reset - time.time()
+        if delay <= 0:
+            return True
+        delay /= max(remaining, 1)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return False
+        time.sleep(delay)
+        return True
+
+    def upload(self, image, title=None, deadline=None):
+        '''
+        Uploads PNG data as a binary multipart request. Returns the image
+        URL or None if the upload failed or can't be done before deadline,
+        a time.monotonic() value.
+        '''
+
+        if not self._throttle(deadline):
+            return None
+        timeout = self.timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                return None
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.url,
+                files={'image': ('image.png', image, 'image/png')},
+                data={'type': 'file', 'title': title},
+                timeout=timeout
+            )
+        except requests.exceptions.RequestException as e:
+            print(e)
+            return None
+        finally:
+            with self._lock:
+                self.upload_count += 1
+                self.upload_time += time.perf_counter() - start
+
+        self._read_rate_limit(response.headers)
+        if response.status_code == 429 and self.pause is not None:
+            try:
+                self.pause(float(response.headers.get('Retry-After', 60)))
+            except ValueError:
+                self.pause(60)
+        try:
+            response_data = response.json()
+        except ValueError:
+            return None
+        if response_data.get('success'):
+            return response_data['data']['link']
+        return None
+
+    def average_latency(self):
+        ''' Returns the mean upload time in seconds. '''
+
+        with self._lock:
+            if not self.upload_count:
+                return 0.0
+            return self.upload_time / self.upload_count
@@ -0,0 +1,129 @@
+'''
+Kanjibot -- a reddit bot that posts information about kanji
+Copyright (C) 2017  Vojtech Balak
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import threading
+import time
+
+
+class TokenBucket:
+    ''' Allows rate requests per second with bursts of up to capacity. '''
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.waiting = 0
+        self.wait_time = 0.0
+        self.granted = 0
+        self.dropped = 0
+
+    def refill(self, now):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def time_until_token(self):
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class Scheduler:
+    '''
+    Token buckets shared by all outbound requests of the bot. Requests
+    that are not essential can give up at a deadline instead of queueing.
+    '''
+
+    def __init__(self):
+        self.buckets = {}
+        self.condition = threading.Condition()
+
+    def add_service(self, name, per_minute, burst=None):
+        if burst is None:
+            burst = max(1, per_minute // 6)
+        self.buckets[name] = TokenBucket(per_minute / 60, burst)
+
+    def acquire(self, name, deadline=None):
+        '''
+        Blocks until a request to the service is allowed. Returns False
+        if that would take until after deadline, a time.monotonic() value.
+        '''
+
+        bucket = self.buckets[name]
+        start = time.monotonic()
+        with self.condition:
+            bucket.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    bucket.refill(now)
+                    # Tokens come at a fixed rate, so there is no point in
+                    # waiting if the next one comes after the deadline.
+                    if deadline is not None and \
+                            now + bucket.time_until_token() >= deadline:
+                        bucket.dropped += 1
+                        return False
+                    if bucket.tokens >= 1:
+                        bucket.tokens -= 1
+                        bucket.granted += 1
+                        bucket.wait_time += now - start
+                        return True
+
+                    delay = bucket.time_until_token() or 0.05
+                    if deadline is not None:
+                        delay = min(delay, deadline - now)
+                    self.condition.wait(delay)
+            finally:
+                bucket.waiting -= 1
+                self.condition.notify_all()
+
+    def pause(self, name, seconds):
+        ''' Holds back all requests to a service, e.g. after a 429. '''
+
+        bucket = self.buckets[name]
+        with self.condition:
+            bucket.refill(time.monotonic())
+            bucket.tokens = min(bucket.tokens, 0) - seconds * bucket.rate
+
+    def stats(self):
+        '''
+        Returns queue depth, number of granted and dropped requests and
+        the average wait in seconds for each service.
+        '''
+
+        with self.condition:
+            return {
+                name: {
+                    'queued': bucket.waiting,
+                    'granted': bucket.granted,
+                    'dropped': bucket.dropped,
+                    'average_wait': (
+                        bucket.wait_time / bucket.granted
+                        if bucket.granted else 0.0
+                    )
+                }
+                for name, bucket in self.buckets.items()
+            }
+
+    def report(self):
+        return ', '.join(
+            name+': '+str(s['queued'])+' queued, '
+            + str(s['dropped'])+' dropped, '
+            + '{:.2f}s average wait'.format(s['average_wait'])
+            for name, s in sorted(self.stats().items())
+        )
@@ -0,0 +1,76 @@
+import pytest
+
+from kanjibot import claims
+
+LEASE = 60
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(claims.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def workers(tmp_path, clock):
+    path = str(tmp_path / 'claims.db')
+    return (
+        claims.ClaimStore(path, LEASE, 'a'),
+        claims.ClaimStore(path, LEASE, 'b')
+    )
+
+
+def test_one_worker_per_mention(workers):
+    a, b = workers
+    assert a.claim('m1')
+    assert not b.claim('m1')
+    assert b.claim('m2')
+    assert not a.claim('m2')
+
+
+def test_owner_can_claim_again(workers):
+    a, b = workers
+    assert a.claim('m1')
+    assert a.claim('m1')
+    assert not b.claim('m1')
+
+
+def test_take_over_after_lease(workers, clock):
+    a, b = workers
+    assert a.claim('m1')
+    clock[0] += LEASE - 1
+    assert not b.claim('m1')
+    clock[0] += 2
+    assert b.claim('m1')
+    assert not a.claim('m1')
+
+
+def test_done_mention_is_not_claimed_again(workers, clock):
+    a, b = workers
+    assert a.claim('m1')
+    a.complete('m1')
+    assert not b.claim('m1')
+    clock[0] += LEASE * 2
+    assert not b.claim('m1')
+    assert not a.claim('m1')
+
+
+def test_released_mention_can_be_claimed(workers):
+    a, b = workers
+    assert a.claim('m1')
+    b.release('m1')
+    assert not b.claim('m1')
+    a.release('m1')
+    assert b.claim('m1')
+
+
+def test_purge_forgets_old_mentions(workers, clock):
+    a, b = workers
+    assert a.claim('m1')
+    a.complete('m1')
+    assert a.claim('m2')
+    clock[0] += LEASE + 10
+    a.purge(age=5)
+    rows = a.cnx.execute('SELECT `mention_id` FROM `claim`').fetchall()
+    assert rows == [('m2',)]
@@ -0,0 +1,52 @@
+import pytest
+
+from kanjibot import components
+
+# Rows as in the kradfile, with the stand-ins 化 for 亻, 汁 for 氵,
+# 阡 for 阝 on the left and 邦 for 阝 on the right.
+ROWS = [
+    ('化', 5, '化'), ('化', 5, '匕'),
+    ('花', 2, '化'), ('花', 2, '匕'), ('花', 2, '艾'),
+    ('休', 1, '化'), ('休', 1, '木'),
+    ('汁', 7, '十'), ('汁', 7, '汁'),
+    ('海', 3, '汁'), ('海', 3, '毋'),
+    ('院', 4, '阡'), ('院', 4, '元'),
+    ('部', 6, '邦'), ('部', 6, '口'),
+    ('本', 8, '木'),
+]
+
+
+@pytest.fixture
+def index():
+    return components.ComponentIndex(ROWS)
+
+
+@pytest.mark.parametrize('component, kanji', [
+    ('亻', ['休', '花', '化']),
+    ('⺅', ['休', '花', '化']),
+    ('氵', ['海', '汁']),
+    ('阝', ['院', '部']),
+    ('⻏', ['部']),
+    ('⼗', ['汁']),
+])
+def test_variant_forms(index, component, kanji):
+    assert component in index
+    assert index.search([component]) == kanji
+
+
+def test_stand_in_means_the_kanji(index):
+    assert index.search(['化']) == ['花', '化']
+    assert index.count(['化']) == 2
+
+
+def test_unknown_component(index):
+    assert '犬' not in index
+    assert index.search(['亻', '犬']) == []
+
+
+def test_parts_without_punctuation():
+    pytest.importorskip('mysql.connector')
+    from kanjibot import core
+
+    found = core.parse_line('!parts 木口。 亻？ 「」')
+    assert found['parts'] == [['木', '口'], ['亻']]
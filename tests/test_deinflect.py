@@ -0,0 +1,71 @@
+import pytest
+
+from kanjibot import deinflect
+
+DICTIONARY = {
+    '食べる', '行く', '行う', '見る', '見', '来る', '勉強', 'する', '高い',
+    '読む', 'ありがとう', '食べ',
+}
+
+
+def lookup(words):
+    return set(words) & DICTIONARY
+
+
+@pytest.mark.parametrize('text, word, reasons', [
+    ('食べました', '食べる', ['polite', 'past']),
+    ('食べない', '食べる', ['negative']),
+    ('行かない', '行く', ['negative']),
+    ('行かなかった', '行く', ['negative', 'past']),
+    ('行った', '行く', ['past']),
+    ('行って', '行く', ['te-form']),
+    ('来ました', '来る', ['polite', 'past']),
+    ('高かった', '高い', ['past']),
+    ('高くない', '高い', ['negative']),
+    ('読んでいます', '読む', ['te-form', 'progressive', 'polite']),
+    ('勉強する', '勉強', ['suru verb']),
+    ('勉強しました', '勉強', ['suru verb', 'polite', 'past']),
+    ('しました', 'する', ['polite', 'past']),
+    ('した', 'する', ['past']),
+])
+def test_dictionary_form(text, word, reasons):
+    match = deinflect.find(text, lookup)
+    assert match == {'word': word, 'text': text, 'reasons': reasons}
+
+
+@pytest.mark.parametrize('text, word', [
+    # Shorter words that are also in the dictionary must not win.
+    ('見させられる', '見る'),
+    ('見ました', '見る'),
+    ('食べました', '食べる'),
+    ('食べて', '食べる'),
+])
+def test_shorter_word_does_not_win(text, word):
+    assert deinflect.find(text, lookup)['word'] == word
+
+
+def test_word_itself_comes_first():
+    assert deinflect.find('ありがとう', lookup) == {
+        'word': 'ありがとう', 'text': 'ありがとう', 'reasons': []
+    }
+    assert deinflect.find('食べる', lookup)['reasons'] == []
+
+
+def test_no_match():
+    assert deinflect.find('ぴよぴよ', lookup) is None
+
+
+def test_lookup_called_once():
+    calls = []
+
+    def counting_lookup(words):
+        calls.append(words)
+        return lookup(words)
+
+    deinflect.find('行かなかった', counting_lookup)
+    assert len(calls) == 1
+
+
+def test_no_empty_forms():
+    for text in ('する', 'た', 'て', 'ます'):
+        assert all(c['word'] for c in deinflect.deinflect(text))